@@ -3,10 +3,9 @@ Email classification using OpenAI API
 """
 import json
 import re
+import threading
 from typing import Tuple, Optional
 from dataclasses import dataclass
-import openai
-from openai import OpenAI
 
 
 @dataclass
@@ -38,17 +37,33 @@ class EmailClassifier:
     
     def __init__(self, config: ClassifierConfig):
         self.config = config
+        self._client = None
+        self._client_lock = threading.Lock()
+    
+    @property
+    def client(self):
+        """
+        OpenAI client, created on first use.
         
-        # Initialize OpenAI client
-        client_config = {
-            "api_key": config.openai.api_key,
-        }
-        
-        # Set custom endpoint if provided
-        if config.openai.endpoint and config.openai.endpoint != "https://api.openai.com/v1":
-            client_config["base_url"] = self._normalize_endpoint(config.openai.endpoint)
-        
-        self.client = OpenAI(**client_config)
+        Importing the SDK is the most expensive part of startup, so runs that
+        find nothing to classify never pay for it.
+        """
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from openai import OpenAI
+                    
+                    # Initialize OpenAI client
+                    client_config = {
+                        "api_key": self.config.openai.api_key,
+                    }
+                    
+                    # Set custom endpoint if provided
+                    if self.config.openai.endpoint and self.config.openai.endpoint != "https://api.openai.com/v1":
+                        client_config["base_url"] = self._normalize_endpoint(self.config.openai.endpoint)
+                    
+                    self._client = OpenAI(**client_config)
+        return self._client
     
     def _normalize_endpoint(self, endpoint: str) -> str:
         """
@@ -3,8 +3,8 @@ Configuration handling for Gmail AI Telegram Agent
 """
 import os
 import yaml
-from typing import Dict, Any, Optional
-from dataclasses import dataclass
+from typing import Dict, Any, List, Optional
+from dataclasses import dataclass, field
 
 
 @dataclass
@@ -21,6 +21,13 @@ class Files:
     credentials_file: str
     token_file: str
     prompts_file: str
+    thread_store_file: str
+
+
+@dataclass
+class Auth:
+    """OAuth token refresh configuration"""
+    refresh_margin_seconds: int
 
 
 @dataclass
@@ -36,6 +43,69 @@ class OpenAI:
     model: str
     max_tokens: int
     temperature: float
+    max_body_chars: int
+
+
+@dataclass
+class Cache:
+    """Message content cache configuration"""
+    max_bytes: int
+    max_part_bytes: int
+
+
+@dataclass
+class Query:
+    """Gmail search query and what to do with the messages it matches"""
+    name: str
+    query: str
+    action: str
+    priority: int
+    max_messages: int
+
+
+@dataclass
+class Threads:
+    """Thread decision reuse configuration"""
+    decision_ttl_hours: float
+
+
+@dataclass
+class Scheduling:
+    """Priority scheduling configuration"""
+    workers: int
+    high_priority_score: int
+    important_senders: List[str]
+    max_concurrency: Dict[str, int]
+
+
+# Priority classes messages are scheduled in, highest first
+PRIORITY_CLASSES = ('high', 'normal', 'low')
+
+
+@dataclass
+class Coordination:
+    """Multi-worker coordination configuration"""
+    backend: str
+    url: str
+    account: str
+    shards: int
+    worker_id: str
+    lease_ttl_seconds: float
+    heartbeat_seconds: float
+    claim_ttl_seconds: float
+
+
+# Lease backends workers can coordinate through; 'none' runs a single worker
+COORDINATION_BACKENDS = ('none', 'memory', 'sqlite', 'redis')
+
+
+# Actions a query can apply to its messages
+QUERY_ACTIONS = ('classify', 'trash', 'read')
+
+# Used when no queries are configured: classify everything unread in the inbox
+DEFAULT_QUERIES = [
+    {'name': 'inbox', 'query': 'is:unread in:inbox', 'action': 'classify', 'priority': 0, 'max_messages': 100},
+]
 
 
 @dataclass
@@ -52,6 +122,12 @@ class Config:
     polling: Polling
     openai: OpenAI
     telegram: Telegram
+    cache: Cache
+    scheduling: Scheduling
+    threads: Threads
+    auth: Auth
+    coordination: Coordination
+    queries: List[Query] = field(default_factory=list)
 
 
 def load_config(filename: str) -> Config:
@@ -77,7 +153,8 @@ def load_config(filename: str) -> Config:
     files = Files(
         credentials_file=files_data.get('credentials_file', ''),
         token_file=files_data.get('token_file', ''),
-        prompts_file=files_data.get('prompts_file', '')
+        prompts_file=files_data.get('prompts_file', ''),
+        thread_store_file=files_data.get('thread_store_file', 'configs/thread_decisions.json')
     )
 
     # Extract polling
@@ -92,7 +169,8 @@ def load_config(filename: str) -> Config:
         endpoint=openai_data.get('endpoint', ''),
         model=openai_data.get('model', 'gpt-3.5-turbo'),
         max_tokens=openai_data.get('max_tokens', 200),
-        temperature=openai_data.get('temperature', 0.0)
+        temperature=openai_data.get('temperature', 0.0),
+        max_body_chars=openai_data.get('max_body_chars', 0)
     )
 
     # Extract Telegram
@@ -101,12 +179,75 @@ def load_config(filename: str) -> Config:
         important_email_template=telegram_data.get('important_email_template', '')
     )
 
+    # Extract cache
+    cache_data = data.get('cache', {})
+    cache = Cache(
+        max_bytes=cache_data.get('max_bytes', 32 * 1024 * 1024),
+        max_part_bytes=cache_data.get('max_part_bytes', 1024 * 1024)
+    )
+
+    # Extract queries
+    queries = [
+        Query(
+            name=query_data.get('name', ''),
+            query=query_data.get('query', ''),
+            action=query_data.get('action', 'classify'),
+            priority=query_data.get('priority', 0),
+            max_messages=query_data.get('max_messages', 100)
+        )
+        for query_data in (data.get('queries') or DEFAULT_QUERIES)
+    ]
+
+    # Extract scheduling
+    scheduling_data = data.get('scheduling', {})
+    workers = scheduling_data.get('workers', 1)
+    scheduling = Scheduling(
+        workers=workers,
+        high_priority_score=scheduling_data.get('high_priority_score', 50),
+        important_senders=[sender.lower() for sender in scheduling_data.get('important_senders', [])],
+        max_concurrency={
+            priority_class: scheduling_data.get('max_concurrency', {}).get(priority_class, workers)
+            for priority_class in PRIORITY_CLASSES
+        }
+    )
+
+    # Extract threads
+    threads_data = data.get('threads', {})
+    threads = Threads(
+        decision_ttl_hours=threads_data.get('decision_ttl_hours', 72)
+    )
+
+    # Extract auth
+    auth_data = data.get('auth', {})
+    auth = Auth(
+        refresh_margin_seconds=auth_data.get('refresh_margin_seconds', 300)
+    )
+
+    # Extract coordination
+    coordination_data = data.get('coordination', {})
+    coordination = Coordination(
+        backend=coordination_data.get('backend', 'none'),
+        url=coordination_data.get('url', ''),
+        account=coordination_data.get('account', 'default'),
+        shards=coordination_data.get('shards', 16),
+        worker_id=coordination_data.get('worker_id', ''),
+        lease_ttl_seconds=coordination_data.get('lease_ttl_seconds', 30),
+        heartbeat_seconds=coordination_data.get('heartbeat_seconds', 10),
+        claim_ttl_seconds=coordination_data.get('claim_ttl_seconds', 300)
+    )
+
     return Config(
         credentials=credentials,
         files=files,
         polling=polling,
         openai=openai,
-        telegram=telegram
+        telegram=telegram,
+        cache=cache,
+        scheduling=scheduling,
+        threads=threads,
+        auth=auth,
+        coordination=coordination,
+        queries=queries
     )
 
 
@@ -121,6 +262,9 @@ def validate_config(config: Config) -> None:
     if not config.files.prompts_file:
         raise ValueError("prompts_file is required in config.yaml")
 
+    if not config.files.thread_store_file:
+        raise ValueError("thread_store_file must not be empty in config.yaml")
+
     if not config.credentials.openai_api_key:
         raise ValueError("openai_api_key is required in config.yaml")
 
@@ -139,8 +283,66 @@ def validate_config(config: Config) -> None:
     if not (0 <= config.openai.temperature <= 1):
         raise ValueError("temperature must be between 0 and 1 in config.yaml")
 
+    if config.openai.max_body_chars < 0:
+        raise ValueError("max_body_chars must not be negative in config.yaml")
+
     if not config.openai.endpoint:
         raise ValueError("endpoint is required in config.yaml")
 
     if not config.telegram.important_email_template:
         raise ValueError("important_email_template is required in config.yaml")
+
+    if config.cache.max_bytes <= 0:
+        raise ValueError("cache max_bytes must be greater than 0 in config.yaml")
+
+    if not (0 < config.cache.max_part_bytes <= config.cache.max_bytes):
+        raise ValueError("cache max_part_bytes must be between 1 and max_bytes in config.yaml")
+
+    # Access tokens live for an hour; the margin must leave time between refreshes
+    if not (0 <= config.auth.refresh_margin_seconds <= 1800):
+        raise ValueError("refresh_margin_seconds must be between 0 and 1800 in config.yaml")
+
+    if config.threads.decision_ttl_hours <= 0:
+        raise ValueError("decision_ttl_hours must be greater than 0 in config.yaml")
+
+    if config.scheduling.workers <= 0:
+        raise ValueError("scheduling workers must be greater than 0 in config.yaml")
+
+    for priority_class, limit in config.scheduling.max_concurrency.items():
+        if limit <= 0:
+            raise ValueError(f"scheduling max_concurrency for {priority_class} must be greater than 0 in config.yaml")
+
+    coordination = config.coordination
+    if coordination.backend not in COORDINATION_BACKENDS:
+        raise ValueError(f"coordination backend must be one of {', '.join(COORDINATION_BACKENDS)} in config.yaml")
+
+    if coordination.backend in ('sqlite', 'redis') and not coordination.url:
+        raise ValueError(f"coordination url is required for the {coordination.backend} backend in config.yaml")
+
+    if coordination.shards <= 0:
+        raise ValueError("coordination shards must be greater than 0 in config.yaml")
+
+    # A lease must survive one missed heartbeat
+    if not (0 < coordination.heartbeat_seconds * 2 <= coordination.lease_ttl_seconds):
+        raise ValueError("coordination heartbeat_seconds must be positive and at most half of lease_ttl_seconds in config.yaml")
+
+    if coordination.claim_ttl_seconds <= 0:
+        raise ValueError("coordination claim_ttl_seconds must be greater than 0 in config.yaml")
+
+    query_names = set()
+    for query in config.queries:
+        if not query.name:
+            raise ValueError("every query needs a name in config.yaml")
+
+        if query.name in query_names:
+            raise ValueError(f"duplicate query name '{query.name}' in config.yaml")
+        query_names.add(query.name)
+
+        if not query.query:
+            raise ValueError(f"query '{query.name}' needs a Gmail search query in config.yaml")
+
+        if query.action not in QUERY_ACTIONS:
+            raise ValueError(f"query '{query.name}' action must be one of {', '.join(QUERY_ACTIONS)} in config.yaml")
+
+        if query.max_messages <= 0:
+            raise ValueError(f"query '{query.name}' max_messages must be greater than 0 in config.yaml")
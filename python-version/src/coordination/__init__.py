@@ -0,0 +1 @@
+# Multi-worker coordination for Gmail AI Telegram Agent
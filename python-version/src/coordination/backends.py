@@ -0,0 +1,218 @@
+"""
+Lease storage backends for coordinating several workers
+"""
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+
+
+class LeaseBackend(ABC):
+    """
+    Storage for expiring, owner-tagged leases.
+
+    A lease is a key held by one owner until it expires. Owners keep their
+    leases alive by renewing them; a lease that is not renewed in time can be
+    taken over by anyone.
+    """
+
+    @abstractmethod
+    def acquire(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        """Take a free or expired lease, or extend one already held; returns whether owner holds it"""
+
+    @abstractmethod
+    def renew(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        """Extend an unexpired lease held by owner; returns False if it expired or someone else holds it"""
+
+    @abstractmethod
+    def release(self, key: str, owner: str) -> None:
+        """Give up a lease if owner still holds it"""
+
+    @abstractmethod
+    def list_leases(self, prefix: str) -> Dict[str, str]:
+        """Live leases whose key starts with prefix, as key → owner"""
+
+    def close(self) -> None:
+        pass
+
+
+class InMemoryLeaseBackend(LeaseBackend):
+    """
+    Process-local stand-in with the same semantics as the shared backends.
+
+    Useful for trying out sharding with several workers in one process and
+    for tests; it does not coordinate separate processes.
+    """
+
+    def __init__(self):
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._lock = threading.Lock()
+
+    def acquire(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        with self._lock:
+            current = self._leases.get(key)
+            if current is not None and current[0] != owner and current[1] > now:
+                return False
+            self._leases[key] = (owner, now + ttl_seconds)
+            return True
+
+    def renew(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        with self._lock:
+            current = self._leases.get(key)
+            if current is None or current[0] != owner or current[1] <= now:
+                return False
+            self._leases[key] = (owner, now + ttl_seconds)
+            return True
+
+    def release(self, key: str, owner: str) -> None:
+        with self._lock:
+            current = self._leases.get(key)
+            if current is not None and current[0] == owner:
+                del self._leases[key]
+
+    def list_leases(self, prefix: str) -> Dict[str, str]:
+        now = time.time()
+        with self._lock:
+            for key in [key for key, (_, expires_at) in self._leases.items() if expires_at <= now]:
+                del self._leases[key]
+            return {key: owner for key, (owner, _) in self._leases.items() if key.startswith(prefix)}
+
+
+class SQLiteLeaseBackend(LeaseBackend):
+    """
+    Leases in a SQLite database file, shared by all workers on one host.
+
+    Every operation is a single statement, so SQLite's file locking makes
+    it atomic across processes.
+    """
+
+    def __init__(self, filename: str):
+        self._conn = sqlite3.connect(filename, timeout=30, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS leases ("
+                "key TEXT PRIMARY KEY, owner TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+
+    def acquire(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO leases (key, owner, expires_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at "
+                "WHERE leases.owner = excluded.owner OR leases.expires_at <= ?",
+                (key, owner, now + ttl_seconds, now)
+            )
+            return cursor.rowcount == 1
+
+    def renew(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE leases SET expires_at = ? WHERE key = ? AND owner = ? AND expires_at > ?",
+                (now + ttl_seconds, key, owner, now)
+            )
+            return cursor.rowcount == 1
+
+    def release(self, key: str, owner: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def list_leases(self, prefix: str) -> Dict[str, str]:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+            rows = self._conn.execute(
+                "SELECT key, owner FROM leases WHERE substr(key, 1, ?) = ?",
+                (len(prefix), prefix)
+            ).fetchall()
+        return dict(rows)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+# Compare-and-set scripts, so only the current owner can extend or drop a lease
+_ACQUIRE_SCRIPT = """
+local current = redis.call('GET', KEYS[1])
+if current == false or current == ARGV[1] then
+    redis.call('SET', KEYS[1], ARGV[1], 'PX', ARGV[2])
+    return 1
+end
+return 0
+"""
+
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class RedisLeaseBackend(LeaseBackend):
+    """
+    Leases in Redis (or any server speaking its protocol), for workers on several hosts.
+
+    Expiry is handled by Redis itself. Takes a redis:// URL, or an existing
+    client object with get/eval/scan_iter for custom setups.
+    """
+
+    KEY_PREFIX = 'gmail-agent:'
+
+    def __init__(self, url: str = '', client: Optional[Any] = None):
+        if client is None:
+            try:
+                import redis
+            except ImportError:
+                raise ImportError("The redis coordination backend requires the 'redis' package: pip install redis")
+            client = redis.Redis.from_url(url)
+        self._client = client
+
+    def acquire(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        return bool(self._client.eval(_ACQUIRE_SCRIPT, 1, self.KEY_PREFIX + key, owner, int(ttl_seconds * 1000)))
+
+    def renew(self, key: str, owner: str, ttl_seconds: float) -> bool:
+        return bool(self._client.eval(_RENEW_SCRIPT, 1, self.KEY_PREFIX + key, owner, int(ttl_seconds * 1000)))
+
+    def release(self, key: str, owner: str) -> None:
+        self._client.eval(_RELEASE_SCRIPT, 1, self.KEY_PREFIX + key, owner)
+
+    def list_leases(self, prefix: str) -> Dict[str, str]:
+        leases = {}
+        for raw_key in self._client.scan_iter(match=self.KEY_PREFIX + prefix + '*'):
+            owner = self._client.get(raw_key)
+            if owner is None:
+                continue  # expired between SCAN and GET
+            key = raw_key.decode() if isinstance(raw_key, bytes) else raw_key
+            leases[key[len(self.KEY_PREFIX):]] = owner.decode() if isinstance(owner, bytes) else owner
+        return leases
+
+    def close(self) -> None:
+        close = getattr(self._client, 'close', None)
+        if close is not None:
+            close()
+
+
+def create_backend(backend: str, url: str) -> LeaseBackend:
+    """Create a lease backend by name"""
+    if backend == 'memory':
+        return InMemoryLeaseBackend()
+    if backend == 'sqlite':
+        return SQLiteLeaseBackend(url)
+    if backend == 'redis':
+        return RedisLeaseBackend(url)
+    raise ValueError(f"unknown coordination backend: {backend}")
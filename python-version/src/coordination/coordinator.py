@@ -0,0 +1,188 @@
+"""
+Lease-based shard ownership so several workers can split one or more mailboxes
+"""
+import math
+import os
+import socket
+import threading
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Set
+
+from coordination.backends import LeaseBackend
+
+
+def default_worker_id() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def shard_of(key: str, num_shards: int) -> int:
+    """Stable shard number of a thread or message ID"""
+    return zlib.crc32(key.encode()) % num_shards
+
+
+class ShardCoordinator:
+    """
+    Splits an account's mail into shards and keeps a fair share of them leased.
+
+    Every worker heartbeats a membership lease and, on each heartbeat, renews
+    its shard leases, releases shards above its fair share
+    (ceil(shards / live workers)) and picks up free ones below it. Shards
+    are preferred by rendezvous hashing, so workers aim at different shards
+    and only a few move when workers join or leave.
+
+    A shard only counts as owned while its lease is safely within its TTL.
+    Each thread is also claimed right before it is acted on, so a shard
+    changing hands mid-cycle never causes duplicate actions. A claim lives
+    as long as a shard lease and is renewed with it. A finished claim is
+    kept for claim_ttl_seconds so workers with an older listing skip the
+    thread. A failed claim is released so the thread is retried next cycle.
+    """
+
+    def __init__(self, backend: LeaseBackend, account: str, num_shards: int,
+                 worker_id: Optional[str] = None, lease_ttl_seconds: float = 30,
+                 heartbeat_seconds: float = 10, claim_ttl_seconds: float = 300):
+        self.backend = backend
+        self.account = account
+        self.num_shards = num_shards
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_ttl = lease_ttl_seconds
+        self.heartbeat_interval = heartbeat_seconds
+        self.claim_ttl = claim_ttl_seconds
+
+        self._owned: Set[int] = set()
+        self._claims: Set[str] = set()
+        self._renewed_at = 0.0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Take an initial share of shards and keep heartbeating in the background"""
+        self.rebalance()
+        if self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='shard-heartbeat', daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        """Stop heartbeating and hand all shards back right away"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        with self._lock:
+            owned, self._owned = self._owned, set()
+            claims, self._claims = self._claims, set()
+        for thread_id in claims:
+            self.backend.release(self._claim_key(thread_id), self.worker_id)
+        for shard in owned:
+            self.backend.release(self._shard_key(shard), self.worker_id)
+        self.backend.release(self._worker_key(self.worker_id), self.worker_id)
+
+    def rebalance(self) -> None:
+        """One heartbeat: refresh membership, renew leases and move towards a fair share"""
+        started = time.time()
+        self.backend.acquire(self._worker_key(self.worker_id), self.worker_id, self.lease_ttl)
+        workers = self.live_workers()
+        fair_share = math.ceil(self.num_shards / max(1, len(workers)))
+
+        with self._lock:
+            owned = set(self._owned)
+            claims = set(self._claims)
+
+        for thread_id in claims:
+            self.backend.renew(self._claim_key(thread_id), self.worker_id, self.lease_ttl)
+
+        kept = {shard for shard in owned if self.backend.renew(self._shard_key(shard), self.worker_id, self.lease_ttl)}
+
+        # Give back the shards we like least first
+        ranked = self._ranked_shards()
+        for shard in sorted(kept, key=ranked.index, reverse=True)[:max(0, len(kept) - fair_share)]:
+            self.backend.release(self._shard_key(shard), self.worker_id)
+            kept.discard(shard)
+
+        if len(kept) < fair_share:
+            held = self.backend.list_leases(self._shard_key_prefix())
+            for shard in ranked:
+                if len(kept) >= fair_share:
+                    break
+                if shard in kept or self._shard_key(shard) in held:
+                    continue
+                if self.backend.acquire(self._shard_key(shard), self.worker_id, self.lease_ttl):
+                    kept.add(shard)
+
+        with self._lock:
+            self._owned = kept
+            self._renewed_at = started
+
+    def live_workers(self) -> List[str]:
+        prefix = self._worker_key('')
+        return sorted(key[len(prefix):] for key in self.backend.list_leases(prefix))
+
+    def owned_shards(self) -> Set[int]:
+        """Shards whose leases are still safely valid"""
+        with self._lock:
+            # Stop acting well before a missed renewal lets another worker in
+            if time.time() - self._renewed_at > self.lease_ttl - self.heartbeat_interval / 2:
+                return set()
+            return set(self._owned)
+
+    def owns(self, key: str) -> bool:
+        """Whether this worker currently handles a thread or message ID"""
+        return shard_of(key, self.num_shards) in self.owned_shards()
+
+    def claim(self, thread_id: str) -> bool:
+        """Claim a thread right before acting on it; False if it is not ours or another worker has it"""
+        if not self.owns(thread_id):
+            return False
+        if not self.backend.acquire(self._claim_key(thread_id), self.worker_id, self.lease_ttl):
+            return False
+        with self._lock:
+            self._claims.add(thread_id)
+        return True
+
+    def finish(self, thread_id: str, done: bool) -> None:
+        """End a claim: keep it for claim_ttl once the thread is done, release it after a failure"""
+        with self._lock:
+            self._claims.discard(thread_id)
+        if done:
+            self.backend.renew(self._claim_key(thread_id), self.worker_id, self.claim_ttl)
+        else:
+            self.backend.release(self._claim_key(thread_id), self.worker_id)
+
+    def owns_message(self, message: Dict[str, Any]) -> bool:
+        """
+        Whether a listed message falls in this worker's shards, without any backend round trip.
+
+        Sharding is by thread, so a conversation is always handled by one
+        worker and thread decisions stay consistent.
+        """
+        return self.owns(message.get('threadId') or message['id'])
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            try:
+                self.rebalance()
+            except Exception as e:
+                print(f"Error during shard heartbeat: {e}")
+
+    def _ranked_shards(self) -> List[int]:
+        """All shards, most preferred by this worker first"""
+        return sorted(
+            range(self.num_shards),
+            key=lambda shard: zlib.crc32(f"{self.worker_id}:{shard}".encode()),
+            reverse=True
+        )
+
+    def _worker_key(self, worker_id: str) -> str:
+        return f"worker:{self.account}:{worker_id}"
+
+    def _shard_key_prefix(self) -> str:
+        return f"shard:{self.account}:"
+
+    def _shard_key(self, shard: int) -> str:
+        return f"{self._shard_key_prefix()}{shard}"
+
+    def _claim_key(self, thread_id: str) -> str:
+        return f"claim:{self.account}:{thread_id}"
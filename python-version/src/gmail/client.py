@@ -1,24 +1,30 @@
 """
 Gmail OAuth2 client handling
+
+Google SDK modules are imported where they are used, so the OAuth flow and
+the API client only cost startup time when they are actually needed.
 """
 import json
 import os
-from typing import Optional
-from google.auth.transport.requests import Request
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
-from googleapiclient.errors import HttpError
+from typing import Optional, TYPE_CHECKING
+
+from coordination.locks import file_lock
+from gmail.credentials import CredentialsManager, write_token_file
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 
 # Gmail API scopes
 SCOPES = ['https://www.googleapis.com/auth/gmail.modify']
 
 
-def get_credentials(credentials_file: str, token_file: str) -> Credentials:
+def get_credentials(credentials_file: str, token_file: str) -> 'Credentials':
     """
     Get Gmail API credentials, handling OAuth2 flow if needed.
     """
+    from google.oauth2.credentials import Credentials
+    
     creds = None
     
     # Load existing token if available
@@ -33,12 +39,15 @@ def get_credentials(credentials_file: str, token_file: str) -> Credentials:
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
             try:
-                creds.refresh(Request())
+                # Shares the refresh with other processes using the same token file
+                creds = CredentialsManager(creds, token_file, refresh_margin_seconds=0).ensure_valid()
+                return creds
             except Exception as e:
                 print(f"Error refreshing token: {e}")
                 creds = None
         
         if not creds:
+            from google_auth_oauthlib.flow import InstalledAppFlow
             try:
                 flow = InstalledAppFlow.from_client_secrets_file(
                     credentials_file, SCOPES)
@@ -48,8 +57,8 @@ def get_credentials(credentials_file: str, token_file: str) -> Credentials:
         
         # Save the credentials for the next run
         try:
-            with open(token_file, 'w') as token:
-                token.write(creds.to_json())
+            with file_lock(token_file):
+                write_token_file(creds, token_file)
             print(f"Credentials saved to: {token_file}")
         except Exception as e:
             print(f"Warning: Could not save credentials: {e}")
@@ -57,13 +66,33 @@ def get_credentials(credentials_file: str, token_file: str) -> Credentials:
     return creds
 
 
-def create_service(credentials_file: str, token_file: str):
+def create_credentials_manager(credentials_file: str, token_file: str,
+                               refresh_margin_seconds: float = 300) -> CredentialsManager:
+    """
+    Get credentials and wrap them in a manager that keeps them fresh.
+    """
+    creds = get_credentials(credentials_file, token_file)
+    return CredentialsManager(creds, token_file, refresh_margin_seconds)
+
+
+def create_service(credentials_file: str, token_file: str,
+                   credentials_manager: Optional[CredentialsManager] = None):
     """
     Create Gmail service instance.
     """
     try:
-        creds = get_credentials(credentials_file, token_file)
-        service = build('gmail', 'v1', credentials=creds)
-        return service
+        if credentials_manager is not None:
+            creds = credentials_manager.credentials
+        else:
+            creds = get_credentials(credentials_file, token_file)
+        
+        # Build from the discovery document bundled with the installed client library
+        from googleapiclient.discovery import build, build_from_document
+        from googleapiclient.discovery_cache import get_static_doc
+        document = get_static_doc('gmail', 'v1')
+        if document:
+            return build_from_document(document, credentials=creds)
+        # No bundled document: let the client fetch it
+        return build('gmail', 'v1', credentials=creds)
     except Exception as e:
         raise Exception(f"Unable to create Gmail service: {e}")
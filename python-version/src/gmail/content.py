@@ -0,0 +1,320 @@
+"""
+Lazy message content loading with a byte-bounded in-memory cache
+"""
+import base64
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, Iterator, List, Optional
+
+from gmail.service import GmailService
+
+
+# Depth of nested multipart structures requested from the API
+PART_TREE_DEPTH = 4
+
+# Decoded chunk size used when streaming base64url payloads
+DECODE_CHUNK_SIZE = 64 * 1024
+
+
+def _part_fields(extra: str, depth: int) -> str:
+    """Build a partial-response field mask for a (nested) message part tree"""
+    fields = f"partId,mimeType,filename,{extra}"
+    if depth > 0:
+        fields += f",parts({_part_fields(extra, depth - 1)})"
+    return fields
+
+
+# Everything except body data: headers, labels and the part structure
+SUMMARY_FIELDS = (
+    "id,threadId,labelIds,snippet,internalDate,sizeEstimate,"
+    f"payload(headers,{_part_fields('body(size,attachmentId)', PART_TREE_DEPTH)})"
+)
+
+# Inline body data only, used when a stage actually needs the content
+INLINE_DATA_FIELDS = f"payload({_part_fields('body(data)', PART_TREE_DEPTH)})"
+
+
+def iter_b64url_decode(data: str, chunk_size: int = DECODE_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Decode a base64url string incrementally.
+
+    Yields decoded chunks of roughly chunk_size bytes so large payloads
+    never need a second, fully decoded copy in memory.
+    """
+    # 4 encoded characters map to 3 decoded bytes
+    step = max(4, (chunk_size // 3) * 4)
+    for start in range(0, len(data), step):
+        chunk = data[start:start + step]
+        yield base64.urlsafe_b64decode(chunk + '=' * (-len(chunk) % 4))
+
+
+@dataclass
+class MessagePart:
+    """Structure of a single message part, without its content"""
+    part_id: str
+    mime_type: str
+    filename: str
+    size: int
+    attachment_id: str = ''
+
+    @property
+    def is_attachment(self) -> bool:
+        return bool(self.filename) or bool(self.attachment_id)
+
+
+@dataclass
+class MessageSummary:
+    """Message metadata needed by most stages: headers, snippet and part layout"""
+    id: str
+    thread_id: str
+    label_ids: List[str]
+    snippet: str
+    internal_date: int
+    size_estimate: int
+    headers: List[Dict[str, str]]
+    parts: List[MessagePart] = field(default_factory=list)
+
+    def header(self, name: str) -> str:
+        """Extract header value, case-insensitively"""
+        for header in self.headers:
+            if header.get('name', '').lower() == name.lower():
+                return header.get('value', '')
+        return ''
+
+    def find_part(self, part_id: str) -> Optional[MessagePart]:
+        for part in self.parts:
+            if part.part_id == part_id:
+                return part
+        return None
+
+    def approx_size(self) -> int:
+        """Rough in-memory footprint used for cache accounting"""
+        size = 256 + len(self.snippet)
+        for header in self.headers:
+            size += len(header.get('name', '')) + len(header.get('value', ''))
+        return size + 128 * len(self.parts)
+
+
+class ByteLRUCache:
+    """Thread-safe LRU cache bounded by the total size of its values in bytes"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> bool:
+        """Store a value; returns False if it can never fit in the cache"""
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            self._pop_locked(key)
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+        return True
+
+    def pop(self, key: Hashable) -> Any:
+        with self._lock:
+            return self._pop_locked(key)
+
+    def discard_where(self, predicate) -> int:
+        """Remove all entries whose key matches predicate; returns count removed"""
+        with self._lock:
+            keys = [key for key in self._entries if predicate(key)]
+            for key in keys:
+                self._pop_locked(key)
+            return len(keys)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _pop_locked(self, key: Hashable) -> Any:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return None
+        self.current_bytes -= entry[1]
+        return entry[0]
+
+
+class MessageContentStore:
+    """
+    Message content layer shared by all processing stages.
+
+    Summaries (headers, snippet, part layout) are fetched without any body
+    data. Body parts and attachments are fetched by ID only when a stage asks
+    for them, decoded incrementally and kept in a byte-bounded LRU cache.
+    Parts larger than max_part_bytes are streamed and never cached.
+    """
+
+    def __init__(self, gmail_service: GmailService, max_bytes: int, max_part_bytes: int):
+        self.gmail_service = gmail_service
+        self.max_part_bytes = max_part_bytes
+        self.cache = ByteLRUCache(max_bytes)
+
+    def get_summary(self, message_id: str) -> Optional[MessageSummary]:
+        """Get message metadata, fetching it without body data if not cached"""
+        key = ('summary', message_id)
+        summary = self.cache.get(key)
+        if summary is not None:
+            return summary
+
+        message = self.gmail_service.get_message(message_id, fields=SUMMARY_FIELDS)
+        if not message:
+            return None
+        return self._store_summary(message_id, message)
+
+    def prefetch_summaries(self, message_ids: List[str]) -> None:
+        """Fetch summaries of many messages in batch requests ahead of use"""
+        missing = [message_id for message_id in message_ids if self.cache.get(('summary', message_id)) is None]
+        if not missing:
+            return
+        messages = self.gmail_service.get_messages(missing, fields=SUMMARY_FIELDS)
+        for message_id, message in messages.items():
+            self._store_summary(message_id, message)
+
+    def get_part(self, message_id: str, part_id: str) -> Optional[bytes]:
+        """
+        Get decoded content of a single part.
+
+        Returns None if the part does not exist, could not be fetched or is
+        larger than max_part_bytes (use iter_part for those).
+        """
+        key = ('part', message_id, part_id)
+        data = self.cache.get(key)
+        if data is not None:
+            return data
+
+        summary = self.get_summary(message_id)
+        part = summary.find_part(part_id) if summary else None
+        if part is None or part.size > self.max_part_bytes:
+            return None
+
+        if part.attachment_id:
+            encoded = self.gmail_service.get_attachment(message_id, part.attachment_id)
+            if encoded is None:
+                return None
+            data = b''.join(iter_b64url_decode(encoded))
+            self.cache.put(key, data, len(data))
+            return data
+
+        # Inline parts come in one response, so decode and cache them together
+        self._load_inline_parts(message_id)
+        return self.cache.get(key)
+
+    def iter_part(self, message_id: str, part_id: str,
+                  chunk_size: int = DECODE_CHUNK_SIZE) -> Iterator[bytes]:
+        """Stream decoded content of a part without caching it"""
+        cached = self.cache.get(('part', message_id, part_id))
+        if cached is not None:
+            for start in range(0, len(cached), chunk_size):
+                yield cached[start:start + chunk_size]
+            return
+
+        summary = self.get_summary(message_id)
+        part = summary.find_part(part_id) if summary else None
+        if part is None:
+            return
+
+        if part.attachment_id:
+            encoded = self.gmail_service.get_attachment(message_id, part.attachment_id)
+        else:
+            encoded = self._inline_data(message_id).get(part_id)
+        if encoded:
+            yield from iter_b64url_decode(encoded, chunk_size)
+
+    def get_text_body(self, message_id: str, max_chars: int) -> str:
+        """
+        Get up to max_chars of the plain text body.
+
+        Only the first text/plain part is fetched; nothing is loaded when the
+        message has no such part.
+        """
+        summary = self.get_summary(message_id)
+        if not summary or max_chars <= 0:
+            return ''
+
+        for part in summary.parts:
+            if part.mime_type != 'text/plain' or part.is_attachment or part.size == 0:
+                continue
+            data = self.get_part(message_id, part.part_id)
+            if data is None:
+                # Oversized body: decode just enough of the stream
+                chunks, total = [], 0
+                for chunk in self.iter_part(message_id, part.part_id):
+                    chunks.append(chunk)
+                    total += len(chunk)
+                    if total >= max_chars * 4:
+                        break
+                data = b''.join(chunks)
+            return data.decode('utf-8', errors='replace')[:max_chars]
+        return ''
+
+    def evict(self, message_id: str) -> None:
+        """Drop everything cached for a message once no stage needs it anymore"""
+        self.cache.discard_where(lambda key: key[1] == message_id)
+
+    def _store_summary(self, message_id: str, message: Dict[str, Any]) -> MessageSummary:
+        payload = message.get('payload', {})
+        summary = MessageSummary(
+            id=message.get('id', message_id),
+            thread_id=message.get('threadId', ''),
+            label_ids=message.get('labelIds', []),
+            snippet=message.get('snippet', ''),
+            internal_date=int(message.get('internalDate', 0) or 0),
+            size_estimate=int(message.get('sizeEstimate', 0) or 0),
+            headers=payload.get('headers', []),
+            parts=[self._to_part(part) for part in self._walk_parts(payload)],
+        )
+        self.cache.put(('summary', message_id), summary, summary.approx_size())
+        return summary
+
+    def _load_inline_parts(self, message_id: str) -> None:
+        for part_id, encoded in self._inline_data(message_id).items():
+            # Decoded size is at most 3/4 of the encoded length
+            if len(encoded) * 3 // 4 > self.max_part_bytes:
+                continue
+            data = b''.join(iter_b64url_decode(encoded))
+            self.cache.put(('part', message_id, part_id), data, len(data))
+
+    def _inline_data(self, message_id: str) -> Dict[str, str]:
+        message = self.gmail_service.get_message(message_id, fields=INLINE_DATA_FIELDS)
+        if not message:
+            return {}
+        inline = {}
+        for part in self._walk_parts(message.get('payload', {})):
+            data = part.get('body', {}).get('data')
+            if data:
+                inline[part.get('partId', '')] = data
+        return inline
+
+    @staticmethod
+    def _walk_parts(payload: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+        stack = [payload] if payload else []
+        while stack:
+            part = stack.pop()
+            yield part
+            stack.extend(reversed(part.get('parts', [])))
+
+    @staticmethod
+    def _to_part(part: Dict[str, Any]) -> MessagePart:
+        body = part.get('body', {})
+        return MessagePart(
+            part_id=part.get('partId', ''),
+            mime_type=part.get('mimeType', ''),
+            filename=part.get('filename', ''),
+            size=int(body.get('size', 0) or 0),
+            attachment_id=body.get('attachmentId', ''),
+        )
@@ -0,0 +1,179 @@
+"""
+OAuth2 credentials refresh for long-running processes
+"""
+import datetime
+import os
+import tempfile
+import threading
+from typing import Optional, TYPE_CHECKING
+
+from coordination.locks import file_lock
+
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
+
+
+# Longest the background thread sleeps before re-checking the expiry
+MAX_SLEEP_SECONDS = 3600
+
+# Backoff bounds after a failed background refresh
+MIN_RETRY_SECONDS = 5
+MAX_RETRY_SECONDS = 300
+
+
+def write_token_file(creds: 'Credentials', token_file: str) -> None:
+    """
+    Write credentials atomically.
+
+    The token is written to a private temporary file next to token_file and
+    renamed over it, so readers never see a partially written token.
+    """
+    directory = os.path.dirname(os.path.abspath(token_file))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.token.')
+    try:
+        with os.fdopen(fd, 'w') as token:
+            token.write(creds.to_json())
+        os.replace(tmp_path, token_file)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+def _utcnow() -> datetime.datetime:
+    # Credentials keep their expiry as a naive UTC datetime
+    return datetime.datetime.now(datetime.timezone.utc).replace(tzinfo=None)
+
+
+class CredentialsManager:
+    """
+    Keeps Gmail credentials valid without blocking API calls on a refresh.
+
+    A background thread refreshes the token refresh_margin_seconds before it
+    expires. Callers use ensure_valid() before a request: it returns at once
+    while the token is still valid, even if a background refresh is running
+    or has just failed. Only an invalid token makes callers wait, and they
+    all join the single in-flight refresh instead of starting their own.
+    Refreshes are serialized across processes with a file lock, and a token
+    already refreshed by another process is picked up from the token file
+    instead of being refreshed again.
+    """
+
+    def __init__(self, creds: 'Credentials', token_file: str, refresh_margin_seconds: float = 300):
+        self.credentials = creds
+        self.token_file = token_file
+        self.refresh_margin = datetime.timedelta(seconds=refresh_margin_seconds)
+        self._refresh_lock = threading.Lock()
+        self._attempts = 0
+        self._last_error: Optional[Exception] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        """Start proactive background refreshing"""
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, name='credentials-refresh', daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def needs_refresh(self) -> bool:
+        """Whether the token is missing, expired or about to expire"""
+        creds = self.credentials
+        if not creds.refresh_token:
+            return False
+        if not creds.token or creds.expiry is None:
+            return not creds.valid
+        return creds.expiry - self.refresh_margin <= _utcnow()
+
+    def ensure_valid(self) -> 'Credentials':
+        """
+        Return credentials for a request, refreshing them only if they are invalid.
+
+        Raises the refresh error if the token is invalid and could not be
+        refreshed; callers that waited on a failed refresh get the same error
+        rather than retrying it one after another.
+        """
+        if self.credentials.valid or not self.credentials.refresh_token:
+            return self.credentials
+
+        attempt = self._attempts
+        with self._refresh_lock:
+            if self._attempts != attempt:
+                # A refresh finished while we waited for it
+                if self.credentials.valid or self._last_error is None:
+                    return self.credentials
+                raise self._last_error
+            if not self.credentials.valid:
+                self._attempt_refresh_locked()
+        return self.credentials
+
+    def refresh_ahead(self) -> None:
+        """Refresh a token that is about to expire; used by the background thread"""
+        with self._refresh_lock:
+            if self.needs_refresh():
+                self._attempt_refresh_locked()
+
+    def _attempt_refresh_locked(self) -> None:
+        self._attempts += 1
+        try:
+            self._refresh_locked()
+            self._last_error = None
+        except Exception as e:
+            self._last_error = e
+            raise
+
+    def _refresh_locked(self) -> None:
+        from google.auth.transport.requests import Request
+        from google.oauth2.credentials import Credentials
+
+        with file_lock(self.token_file):
+            # Another worker process may have refreshed in the meantime
+            try:
+                stored = Credentials.from_authorized_user_file(self.token_file, self.credentials.scopes)
+            except (OSError, ValueError):
+                stored = None
+            if stored and stored.token and stored.expiry and stored.expiry - self.refresh_margin > _utcnow():
+                self.credentials.token = stored.token
+                self.credentials.expiry = stored.expiry
+                return
+
+            self.credentials.refresh(Request())
+            try:
+                write_token_file(self.credentials, self.token_file)
+            except OSError as e:
+                print(f"Warning: Could not save refreshed credentials: {e}")
+
+    def _seconds_until_refresh(self) -> float:
+        creds = self.credentials
+        if not creds.refresh_token:
+            return MAX_SLEEP_SECONDS
+        if creds.expiry is None:
+            return 0 if not creds.valid else MAX_SLEEP_SECONDS
+        return (creds.expiry - self.refresh_margin - _utcnow()).total_seconds()
+
+    def _run(self) -> None:
+        failures = 0
+        while not self._stop.is_set():
+            delay = self._seconds_until_refresh()
+            if delay > 0:
+                self._stop.wait(min(delay, MAX_SLEEP_SECONDS))
+                continue
+
+            try:
+                # A failure leaves the current token in use until it really expires
+                self.refresh_ahead()
+                failures = 0
+                # Tokens shorter-lived than the margin must not cause a busy loop
+                if self._seconds_until_refresh() <= 0:
+                    self._stop.wait(MIN_RETRY_SECONDS)
+            except Exception as e:
+                failures += 1
+                retry = min(MAX_RETRY_SECONDS, MIN_RETRY_SECONDS * 2 ** (failures - 1))
+                print(f"Error refreshing credentials, retrying in {retry}s: {e}")
+                self._stop.wait(retry)
@@ -0,0 +1,112 @@
+"""
+Query planning: server-side prefiltering of the inbox with Gmail search queries
+"""
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from config.config import Query
+from gmail.service import GmailService
+
+
+@dataclass
+class QueryStats:
+    """Per-query volume statistics for the current cycle and since startup"""
+    listed: int = 0
+    duplicates: int = 0
+    processed: int = 0
+    list_seconds: float = 0.0
+    process_seconds: float = 0.0
+    total_listed: int = 0
+    total_processed: int = 0
+
+    def start_cycle(self) -> None:
+        self.listed = 0
+        self.duplicates = 0
+        self.processed = 0
+        self.list_seconds = 0.0
+        self.process_seconds = 0.0
+
+
+class QueryPlanner:
+    """
+    Runs the configured Gmail queries in priority order (lowest value first).
+
+    Each message is assigned to the first query that matches it, so a message
+    picked up by an earlier query is never acted on twice in the same cycle.
+    Queries with a bulk action (trash, read) are applied with a single batch
+    request and never reach the classifier.
+    """
+
+    def __init__(self, gmail_service: GmailService, queries: List[Query]):
+        self.gmail_service = gmail_service
+        self.queries = sorted(queries, key=lambda query: query.priority)
+        self.stats: Dict[str, QueryStats] = {query.name: QueryStats() for query in self.queries}
+        self._lock = threading.Lock()
+
+    def collect(self, keep: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Tuple[Query, List[Dict[str, Any]]]]:
+        """
+        List messages for every query, within each query's budget.
+
+        With keep, such as a worker's shard filter, the budget counts only
+        the messages it accepts.
+        """
+        seen = set()
+        batches = []
+        for query in self.queries:
+            stats = self.stats[query.name]
+            stats.start_cycle()
+
+            started = time.monotonic()
+            listed = self.gmail_service.list_messages(query.query, query.max_messages, keep)
+            stats.list_seconds = time.monotonic() - started
+
+            messages = []
+            for message in listed:
+                if message['id'] in seen:
+                    stats.duplicates += 1
+                    continue
+                seen.add(message['id'])
+                messages.append(message)
+
+            stats.listed = len(listed)
+            stats.total_listed += len(listed)
+            batches.append((query, messages))
+        return batches
+
+    def apply_bulk(self, query: Query, messages: List[Dict[str, Any]]) -> int:
+        """Apply a bulk action to all messages of a query; returns the number of messages changed"""
+        message_ids = [message['id'] for message in messages]
+        if not message_ids:
+            return 0
+
+        started = time.monotonic()
+        if query.action == 'trash':
+            changed = self.gmail_service.batch_trash(message_ids)
+        elif query.action == 'read':
+            changed = self.gmail_service.batch_mark_as_read(message_ids)
+        else:
+            raise ValueError(f"query '{query.name}' has no bulk action: {query.action}")
+        self.record(query, changed, time.monotonic() - started)
+        return changed
+
+    def record(self, query: Query, processed: int, seconds: float) -> None:
+        """Record messages processed for a query; may be called from worker threads"""
+        with self._lock:
+            stats = self.stats[query.name]
+            stats.processed += processed
+            stats.total_processed += processed
+            stats.process_seconds += seconds
+
+    def report(self) -> str:
+        """Per-query volume report for the last cycle"""
+        lines = []
+        for query in self.queries:
+            stats = self.stats[query.name]
+            lines.append(
+                f"  {query.name} ({query.action}): listed={stats.listed} duplicates={stats.duplicates} "
+                f"processed={stats.processed} list={stats.list_seconds:.2f}s process={stats.process_seconds:.2f}s "
+                f"total_listed={stats.total_listed} total_processed={stats.total_processed}"
+            )
+        return "Query stats:\n" + "\n".join(lines)
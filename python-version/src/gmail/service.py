@@ -1,52 +1,169 @@
 """
 Gmail service wrapper for email operations
 """
-from typing import List, Dict, Any, Optional
-from googleapiclient.discovery import Resource
+import threading
+from typing import Callable, List, Dict, Any, Optional, TYPE_CHECKING
 from googleapiclient.errors import HttpError
 
+if TYPE_CHECKING:
+    from googleapiclient.discovery import Resource
+    from gmail.credentials import CredentialsManager
+
+
+# Maximum number of calls the Gmail API recommends per batch request
+BATCH_SIZE = 50
+
 
 class GmailService:
-    """Gmail service wrapper class"""
+    """Gmail service wrapper class, safe to share between worker threads"""
     
-    def __init__(self, service: Resource):
+    def __init__(self, service: 'Resource', credentials_manager: Optional['CredentialsManager'] = None):
         self.service = service
+        self.credentials_manager = credentials_manager
+        # The underlying HTTP transport is not thread-safe
+        self._lock = threading.Lock()
+    
+    def _execute(self, request):
+        """Execute an API request, serialized across threads"""
+        # Normally a no-op: the manager refreshes ahead of expiry in the background
+        if self.credentials_manager is not None:
+            self.credentials_manager.ensure_valid()
+        with self._lock:
+            return request.execute()
+    
+    def get_profile_email(self) -> str:
+        """Get the email address of the authenticated account"""
+        try:
+            profile = self._execute(self.service.users().getProfile(userId='me'))
+            return profile.get('emailAddress', '')
+        except HttpError as error:
+            print(f"Error getting profile: {error}")
+            return ''
     
     def list_unread_messages(self) -> List[Dict[str, Any]]:
         """List unread messages in inbox"""
+        return self.list_messages('is:unread in:inbox')
+    
+    def list_messages(self, query: str, max_messages: int = 100,
+                      keep: Optional[Callable[[Dict[str, Any]], bool]] = None) -> List[Dict[str, Any]]:
+        """
+        List up to max_messages messages matching a Gmail search query.
+
+        With keep, only messages it accepts are returned and count towards
+        max_messages; pages are listed until enough are kept or none are left.
+        """
+        messages = []
+        page_token = None
         try:
-            results = self.service.users().messages().list(
-                userId='me', 
-                q='is:unread in:inbox'
-            ).execute()
-            
-            messages = results.get('messages', [])
-            return messages
+            while len(messages) < max_messages:
+                results = self._execute(self.service.users().messages().list(
+                    userId='me',
+                    q=query,
+                    maxResults=500 if keep else min(500, max_messages - len(messages)),
+                    pageToken=page_token
+                ))
+                
+                page = results.get('messages', [])
+                messages.extend(page if keep is None else [message for message in page if keep(message)])
+                page_token = results.get('nextPageToken')
+                if not page_token:
+                    break
+            return messages[:max_messages]
         except HttpError as error:
-            print(f"Error listing messages: {error}")
-            return []
+            print(f"Error listing messages for '{query}': {error}")
+            return messages
     
-    def get_message(self, message_id: str) -> Optional[Dict[str, Any]]:
-        """Get full message details"""
+    def get_message(self, message_id: str, fields: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Get full message details, optionally limited to a partial-response field mask"""
         try:
-            message = self.service.users().messages().get(
+            message = self._execute(self.service.users().messages().get(
                 userId='me', 
                 id=message_id, 
-                format='full'
-            ).execute()
+                format='full',
+                fields=fields
+            ))
             return message
         except HttpError as error:
             print(f"Error getting message {message_id}: {error}")
             return None
     
+    def get_messages(self, message_ids: List[str], fields: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+        """Get many messages using batch requests; returns messages by ID, skipping failures"""
+        messages = {}
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                print(f"Error getting message {request_id}: {exception}")
+            else:
+                messages[request_id] = response
+        
+        for start in range(0, len(message_ids), BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for message_id in message_ids[start:start + BATCH_SIZE]:
+                batch.add(
+                    self.service.users().messages().get(
+                        userId='me',
+                        id=message_id,
+                        format='full',
+                        fields=fields
+                    ),
+                    request_id=message_id
+                )
+            try:
+                self._execute(batch)
+            except HttpError as error:
+                print(f"Error getting batch of messages: {error}")
+        return messages
+    
+    def get_sent_threads(self, thread_ids: List[str]) -> Dict[str, bool]:
+        """Check in batch requests whether the authenticated account sent any message in each thread; skips failures"""
+        sent = {}
+        
+        def on_response(request_id, response, exception):
+            if exception is not None:
+                print(f"Error getting thread {request_id}: {exception}")
+            else:
+                sent[request_id] = any('SENT' in message.get('labelIds', []) for message in response.get('messages', []))
+        
+        for start in range(0, len(thread_ids), BATCH_SIZE):
+            batch = self.service.new_batch_http_request(callback=on_response)
+            for thread_id in thread_ids[start:start + BATCH_SIZE]:
+                batch.add(
+                    self.service.users().threads().get(
+                        userId='me',
+                        id=thread_id,
+                        format='minimal',
+                        fields='messages/labelIds'
+                    ),
+                    request_id=thread_id
+                )
+            try:
+                self._execute(batch)
+            except HttpError as error:
+                print(f"Error getting batch of threads: {error}")
+        return sent
+    
+    def get_attachment(self, message_id: str, attachment_id: str) -> Optional[str]:
+        """Get base64url-encoded attachment data"""
+        try:
+            attachment = self._execute(self.service.users().messages().attachments().get(
+                userId='me',
+                messageId=message_id,
+                id=attachment_id
+            ))
+            return attachment.get('data', '')
+        except HttpError as error:
+            print(f"Error getting attachment {attachment_id} of message {message_id}: {error}")
+            return None
+    
     def mark_as_read(self, message_id: str) -> bool:
         """Mark message as read"""
         try:
-            self.service.users().messages().modify(
+            self._execute(self.service.users().messages().modify(
                 userId='me',
                 id=message_id,
                 body={'removeLabelIds': ['UNREAD']}
-            ).execute()
+            ))
             return True
         except HttpError as error:
             print(f"Error marking message {message_id} as read: {error}")
@@ -55,15 +172,44 @@ class GmailService:
     def trash_message(self, message_id: str) -> bool:
         """Move message to trash"""
         try:
-            self.service.users().messages().trash(
+            self._execute(self.service.users().messages().trash(
                 userId='me',
                 id=message_id
-            ).execute()
+            ))
             return True
         except HttpError as error:
             print(f"Error trashing message {message_id}: {error}")
             return False
     
+    def batch_modify(self, message_ids: List[str], add_label_ids: Optional[List[str]] = None,
+                     remove_label_ids: Optional[List[str]] = None) -> int:
+        """Change labels of many messages at once; returns the number of messages modified"""
+        modified = 0
+        # The API accepts at most 1000 IDs per request
+        for start in range(0, len(message_ids), 1000):
+            chunk = message_ids[start:start + 1000]
+            try:
+                self._execute(self.service.users().messages().batchModify(
+                    userId='me',
+                    body={
+                        'ids': chunk,
+                        'addLabelIds': add_label_ids or [],
+                        'removeLabelIds': remove_label_ids or []
+                    }
+                ))
+                modified += len(chunk)
+            except HttpError as error:
+                print(f"Error modifying {len(chunk)} messages: {error}")
+        return modified
+    
+    def batch_trash(self, message_ids: List[str]) -> int:
+        """Move many messages to trash"""
+        return self.batch_modify(message_ids, add_label_ids=['TRASH'])
+    
+    def batch_mark_as_read(self, message_ids: List[str]) -> int:
+        """Mark many messages as read"""
+        return self.batch_modify(message_ids, remove_label_ids=['UNREAD'])
+    
     def get_header(self, headers: List[Dict[str, str]], name: str) -> str:
         """Extract header value from message headers"""
         for header in headers:
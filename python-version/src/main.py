@@ -27,69 +27,203 @@ Note: This is a prototype. For production you should:
 --------------------------------------------------------
 """
 
+import time
+
+# Taken before any project or SDK import, for the startup-time report
+STARTED_AT = time.perf_counter()
+
+import argparse
+import signal
 import sys
 import os
-import time
 import re
-from typing import Optional
+from typing import List, Optional, Tuple
 
 # Add src directory to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from config.config import load_config, validate_config
+from config.config import load_config, validate_config, PRIORITY_CLASSES
 from config.prompts import load_prompts
-from gmail.client import create_service
+from gmail.client import create_credentials_manager, create_service
 from gmail.service import GmailService
+from gmail.content import MessageContentStore
+from gmail.queries import QueryPlanner
+from processing.priority import PriorityScorer, PriorityScheduler
+from coordination.backends import create_backend
+from coordination.coordinator import ShardCoordinator
+from processing.threads import ThreadDecisionStore, ScheduledThread, group_by_thread, is_content_free, sender_addresses
 from telegram.send import send_message
 from classifier.classifying import EmailClassifier, ClassifierConfig, OpenAIConfig, EmailClassificationConfig
 
 
+class StartupTimer:
+    """Durations of startup phases, reported once the first cycle is done"""
+    
+    def __init__(self, started_at: float):
+        self.started_at = started_at
+        self.last = started_at
+        self.phases: List[Tuple[str, float]] = []
+    
+    def mark(self, phase: str) -> None:
+        """End the current phase"""
+        now = time.perf_counter()
+        self.phases.append((phase, now - self.last))
+        self.last = now
+    
+    def report(self) -> str:
+        phases = ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in self.phases)
+        return f"Startup time: {phases}, total={self.last - self.started_at:.2f}s"
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """Parse command line arguments"""
+    parser = argparse.ArgumentParser(description="Gmail → AI → Telegram agent")
+    parser.add_argument("--config", default="configs/config.yaml", help="path to config.yaml")
+    parser.add_argument("--once", action="store_true",
+                        help="process the inbox a single time and exit (for cron and one-shot containers)")
+    return parser.parse_args(argv)
+
+
+def handle_sigterm(signum, frame):
+    """Stop on SIGTERM (docker stop, systemd) the same way as on Ctrl-C"""
+    raise KeyboardInterrupt
+
+
 def escape_markdown(text: str) -> str:
     """Simple markdown escape for a few characters"""
     return re.sub(r'([_*\[\]])', r'\\\1', text)
 
 
-def process_inbox(classifier: EmailClassifier, gmail_service: GmailService, config, telegram_token: str, chat_id: str):
-    """Process all unread messages in INBOX"""
-    # List unread messages in INBOX
-    messages = gmail_service.list_unread_messages()
+def process_inbox(classifier: EmailClassifier, gmail_service: GmailService, content_store: MessageContentStore, planner: QueryPlanner, scorer: PriorityScorer, scheduler: PriorityScheduler, thread_store: ThreadDecisionStore, coordinator: Optional[ShardCoordinator], config, telegram_token: str, chat_id: str):
+    """Process all messages matched by the configured Gmail queries"""
+    # With several workers, list only this worker's shards, each query's budget filled
+    # from them; threads are claimed when handled
+    keep = None
+    if coordinator is not None:
+        if not coordinator.owned_shards():
+            print("No shards owned by this worker yet.")
+            return
+        keep = coordinator.owns_message
+    
+    # List messages per query; filtering happens on Gmail's side
+    batches = planner.collect(keep)
     
-    if not messages:
+    if not any(messages for _, messages in batches):
         print("No unread messages.")
         return
     
-    print(f"Processing {len(messages)} unread messages...")
+    scorer.start_cycle()
+    pending = []
+    
+    for query, messages in batches:
+        if not messages:
+            continue
+        
+        if query.action == 'classify':
+            # Score from metadata only, fetched in batches and reused by process_thread
+            content_store.prefetch_summaries([message['id'] for message in messages])
+            for message in messages:
+                summary = content_store.get_summary(message['id'])
+                if not summary:
+                    print(f"Could not retrieve message {message['id']}")
+                    continue
+                pending.append((message, summary, query))
+            continue
+        
+        # Bulk actions skip the classifier entirely
+        print(f"Processing {len(messages)} messages from query '{query.name}' ({query.action})...")
+        changed = planner.apply_bulk(query, messages)
+        if query.action == 'trash' and changed:
+            msg_about_trashed = f"🗑 Trashed {changed} messages matching query {query.name}"
+            send_message(telegram_token, chat_id, escape_markdown(msg_about_trashed))
+            print(msg_about_trashed)
+        elif changed:
+            print(f"Marked {changed} messages matching query {query.name} as read")
+    
+    # Thread lookups for replies are made in one batched pass before anything is scored
+    scorer.prefetch_threads([summary for _, summary, _ in pending])
+    scheduled = [scorer.schedule(message, summary, query) for message, summary, query in pending]
     
-    for message in messages:
-        process_email(classifier, gmail_service, config, telegram_token, chat_id, message)
+    if scheduled:
+        # Each conversation is classified and notified once per cycle
+        threads = group_by_thread(scheduled)
+        counts = ", ".join(
+            f"{priority_class}={sum(1 for thread in threads if thread.priority_class == priority_class)}"
+            for priority_class in PRIORITY_CLASSES
+        )
+        print(f"Processing {len(scheduled)} messages in {len(threads)} threads by priority ({counts})...")
+        
+        def handle(thread: ScheduledThread):
+            if coordinator is not None and not coordinator.claim(thread.thread_id):
+                print(f"Skipping thread {thread.thread_id}, handled by another worker")
+                return
+            started = time.monotonic()
+            done = False
+            try:
+                done = process_thread(classifier, gmail_service, content_store, thread_store, config, telegram_token, chat_id, thread)
+            finally:
+                # A failed thread is released so it is retried next cycle
+                if coordinator is not None:
+                    coordinator.finish(thread.thread_id, done)
+            # Credit each message to the query that listed it
+            elapsed = (time.monotonic() - started) / len(thread.messages)
+            for item in thread.messages:
+                planner.record(item.query, 1, elapsed)
+        
+        scheduler.run(threads, handle)
+        thread_store.save()
+    
+    print(planner.report())
 
 
-def process_email(classifier: EmailClassifier, gmail_service: GmailService, config, telegram_token: str, chat_id: str, message: dict):
-    """Process a single email"""
-    message_id = message['id']
-    
-    # Get full message details
-    msg_full = gmail_service.get_message(message_id)
-    if not msg_full:
-        print(f"Could not retrieve message {message_id}")
-        return
+def process_thread(classifier: EmailClassifier, gmail_service: GmailService, content_store: MessageContentStore, thread_store: ThreadDecisionStore, config, telegram_token: str, chat_id: str, thread: ScheduledThread) -> bool:
+    """Process the new messages of one thread with a single decision and notification; returns whether it was done"""
+    summaries = thread.summaries
+    message_ids = [summary.id for summary in summaries]
+    latest = summaries[-1]
     
     # Extract email details
-    snippet = msg_full.get('snippet', '')
-    headers = msg_full.get('payload', {}).get('headers', [])
-    
-    subject = gmail_service.get_header(headers, 'Subject')
-    from_addr = gmail_service.get_header(headers, 'From')
-    preview = snippet
+    senders = sender_addresses(summaries)
+    subject = latest.header('Subject')
+    if len(summaries) == 1:
+        from_addr = latest.header('From')
+        preview = latest.snippet
+    else:
+        from_addr = ", ".join(senders)
+        preview = "\n".join(f"{summary.header('From')}: {summary.snippet}" for summary in summaries)
     
-    # Compose text for classifier
-    input_text = f"From: {from_addr}\nSubject: {subject}\n\n{preview}"
+    prior = thread_store.get(thread.thread_id)
+    if (prior and prior.important
+            and all(sender in prior.participants for sender in senders)
+            and all(is_content_free(summary) for summary in summaries)):
+        # Acknowledgements among the same participants keep an important thread's decision;
+        # anything else, and anything that could end up trashed, goes to the model
+        important, reason = prior.important, prior.reason
+        print(f"Reusing decision for thread {thread.thread_id} ({len(summaries)} new messages)")
+    else:
+        # Compose text for classifier: the prior decision plus the new messages as deltas
+        blocks = []
+        for summary in summaries:
+            # Classify on the beginning of the plain text body instead of the snippet if configured
+            content = summary.snippet
+            if config.openai.max_body_chars > 0:
+                content = content_store.get_text_body(summary.id, config.openai.max_body_chars) or content
+            blocks.append(f"From: {summary.header('From')}\nSubject: {summary.header('Subject')}\n\n{content}")
+        input_text = "\n\n---\n\n".join(blocks)
+        if prior:
+            decision = "important" if prior.important else "unimportant"
+            input_text = (f"Earlier messages in this conversation were classified as {decision}: {prior.reason}\n\n"
+                          f"New messages:\n\n{input_text}")
+        
+        # Classify thread
+        important, reason = classifier.classify_email(input_text)
     
-    # Classify email
-    important, reason = classifier.classify_email(input_text)
+    participants = list(prior.participants) if prior else []
+    participants += [sender for sender in senders if sender not in participants]
+    thread_store.put(thread.thread_id, important, reason, participants)
     
     if important:
-        # Send Telegram notification, mark as read
+        # Send one Telegram notification for the thread, mark all as read
         body = config.telegram.important_email_template % (
             escape_markdown(from_addr),
             escape_markdown(subject),
@@ -100,23 +234,30 @@ def process_email(classifier: EmailClassifier, gmail_service: GmailService, conf
         success = send_message(telegram_token, chat_id, body)
         if success:
             # Mark as read to avoid re-processing
-            gmail_service.mark_as_read(message_id)
+            gmail_service.batch_mark_as_read(message_ids)
             print(f"Important email processed: {from_addr} - {subject}")
-        else:
-            print(f"Failed to send Telegram message for: {from_addr} - {subject}")
+            return True
+        print(f"Failed to send Telegram message for: {from_addr} - {subject}")
+        return False
     else:
-        # Trash the message as unimportant
-        msg_about_trashed = f"🗑 Trashed message from {from_addr} subject={subject}"
+        # Trash the messages as unimportant
+        if len(summaries) == 1:
+            msg_about_trashed = f"🗑 Trashed message from {from_addr} subject={subject}"
+        else:
+            msg_about_trashed = f"🗑 Trashed {len(summaries)} messages from {from_addr} subject={subject}"
         
         success = send_message(telegram_token, chat_id, msg_about_trashed)
         if success:
-            # Trash the message
-            if gmail_service.trash_message(message_id):
+            # Trash the messages
+            if gmail_service.batch_trash(message_ids) == len(message_ids):
+                for message_id in message_ids:
+                    content_store.evict(message_id)
                 print(msg_about_trashed)
-            else:
-                print(f"Failed to trash message {message_id}")
+                return True
+            print(f"Failed to trash messages of thread {thread.thread_id}")
         else:
             print(f"Failed to send Telegram message about trashed email: {from_addr} - {subject}")
+        return False
 
 
 def create_classifier(config, prompts):
@@ -144,7 +285,11 @@ def create_classifier(config, prompts):
 
 def main():
     """Main application entry point"""
-    config_file = "configs/config.yaml"
+    timer = StartupTimer(STARTED_AT)
+    timer.mark("imports")
+    
+    args = parse_args()
+    config_file = args.config
     
     # Load configuration from YAML
     try:
@@ -166,39 +311,113 @@ def main():
     except Exception as e:
         print(f"Unable to load prompts: {e}")
         sys.exit(1)
+    timer.mark("config")
     
     # Create Gmail service
     try:
-        gmail_service_raw = create_service(config.files.credentials_file, config.files.token_file)
-        gmail_service = GmailService(gmail_service_raw)
+        credentials_manager = create_credentials_manager(
+            config.files.credentials_file,
+            config.files.token_file,
+            config.auth.refresh_margin_seconds
+        )
+        gmail_service_raw = create_service(
+            config.files.credentials_file,
+            config.files.token_file,
+            credentials_manager=credentials_manager
+        )
+        gmail_service = GmailService(gmail_service_raw, credentials_manager=credentials_manager)
     except Exception as e:
         print(f"Unable to retrieve Gmail client: {e}")
         sys.exit(1)
+    timer.mark("gmail")
+    
+    # One-shot runs finish long before the token expires
+    if not args.once:
+        credentials_manager.start()
+    
+    content_store = MessageContentStore(gmail_service, config.cache.max_bytes, config.cache.max_part_bytes)
+    planner = QueryPlanner(gmail_service, config.queries)
+    scorer = PriorityScorer(gmail_service, config.scheduling)
+    scheduler = PriorityScheduler(config.scheduling)
+    thread_store = ThreadDecisionStore(config.files.thread_store_file, config.threads.decision_ttl_hours * 3600)
+    
+    # Split the mailbox with other workers if coordination is configured
+    coordinator = None
+    if config.coordination.backend != 'none':
+        try:
+            coordinator = ShardCoordinator(
+                create_backend(config.coordination.backend, config.coordination.url),
+                config.coordination.account,
+                config.coordination.shards,
+                worker_id=config.coordination.worker_id or None,
+                lease_ttl_seconds=config.coordination.lease_ttl_seconds,
+                heartbeat_seconds=config.coordination.heartbeat_seconds,
+                claim_ttl_seconds=config.coordination.claim_ttl_seconds
+            )
+            # One-shot runs heartbeat too, so leases and claims outlive lease_ttl_seconds
+            coordinator.start()
+        except Exception as e:
+            print(f"Unable to set up coordination: {e}")
+            sys.exit(1)
+        print(f"Worker {coordinator.worker_id} owns {len(coordinator.owned_shards())} of {config.coordination.shards} shards")
     
-    print("Agent started — polling Gmail for unread messages...")
+    if args.once:
+        print("Agent started — processing unread messages once...")
+    else:
+        print("Agent started — polling Gmail for unread messages...")
     
-    # Create classifier
+    # Create classifier; the OpenAI client is only set up once there is mail to classify
     classifier = create_classifier(config, prompts)
+    timer.mark("setup")
     
     # Main polling loop
     poll_interval = config.polling.interval_seconds
+    first_cycle = True
     
-    while True:
-        try:
-            process_inbox(
-                classifier, 
-                gmail_service, 
-                config,
-                config.credentials.telegram_bot_token,
-                config.credentials.telegram_chat_id
-            )
-        except KeyboardInterrupt:
-            print("\nShutting down...")
-            break
-        except Exception as e:
-            print(f"Error processing inbox: {e}")
-        
-        time.sleep(poll_interval)
+    # Stop cleanly on SIGTERM as well as Ctrl-C
+    signal.signal(signal.SIGTERM, handle_sigterm)
+    
+    failed = False
+    try:
+        while True:
+            failed = False
+            try:
+                process_inbox(
+                    classifier, 
+                    gmail_service, 
+                    content_store,
+                    planner,
+                    scorer,
+                    scheduler,
+                    thread_store,
+                    coordinator,
+                    config,
+                    config.credentials.telegram_bot_token,
+                    config.credentials.telegram_chat_id
+                )
+            except Exception as e:
+                print(f"Error processing inbox: {e}")
+                failed = True
+            
+            if first_cycle:
+                timer.mark("first_cycle")
+                print(timer.report())
+                first_cycle = False
+            
+            if args.once:
+                break
+            
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("\nShutting down...")
+    finally:
+        # Hand shards and claims back so other workers take over without waiting for lease expiry
+        if coordinator is not None:
+            coordinator.stop()
+        credentials_manager.stop()
+    
+    if args.once and failed:
+        sys.exit(1)
 
 
 if __name__ == "__main__":
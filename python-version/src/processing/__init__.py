@@ -0,0 +1 @@
+# Message processing pipeline for Gmail AI Telegram Agent
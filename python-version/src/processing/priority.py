@@ -0,0 +1,199 @@
+"""
+Priority scheduling so likely-important mail is classified and notified first
+"""
+import heapq
+import itertools
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from email.utils import getaddresses
+from typing import Any, Callable, Dict, List, Optional
+
+from config.config import PRIORITY_CLASSES, Query, Scheduling
+from gmail.content import MessageSummary
+from gmail.service import GmailService
+
+
+# Score contributions of the individual signals
+IMPORTANT_SENDER_SCORE = 100
+REPLY_TO_OWN_THREAD_SCORE = 40
+DIRECT_RECIPIENT_SCORE = 20
+LIST_MAIL_SCORE = -30
+MAX_RECENCY_SCORE = 10
+
+# Headers that mark mailing list and bulk mail
+LIST_HEADERS = ('List-Id', 'List-Unsubscribe')
+BULK_PRECEDENCE = ('bulk', 'list', 'junk')
+
+
+@dataclass
+class ScheduledMessage:
+    """A message waiting for classification, with its priority"""
+    message: Dict[str, Any]
+    summary: MessageSummary
+    query: Query
+    score: float
+    priority_class: str
+
+    @property
+    def label(self) -> str:
+        return f"message {self.message['id']}"
+
+
+class PriorityScorer:
+    """
+    Scores messages from already-fetched metadata.
+
+    Signals: known-important senders, being a direct To recipient versus
+    list mail, replies in threads we wrote in, and recency. The only extra
+    API calls are minimal thread lookups for replies, made in batches by
+    prefetch_threads() before scoring and cached per cycle.
+    The account address is looked up once, the first time there is mail.
+    """
+
+    def __init__(self, gmail_service: GmailService, config: Scheduling, own_address: Optional[str] = None):
+        self.gmail_service = gmail_service
+        self.own_address = own_address.lower() if own_address is not None else None
+        self.config = config
+        self._own_threads: Dict[str, bool] = {}
+
+    def start_cycle(self) -> None:
+        self._own_threads.clear()
+        if self.own_address is None:
+            # Left unset on failure so the next cycle tries again
+            self.own_address = self.gmail_service.get_profile_email().lower() or None
+
+    def prefetch_threads(self, summaries: List[MessageSummary]) -> None:
+        """Look up in one pass which threads of the given replies we wrote in"""
+        thread_ids = []
+        for summary in summaries:
+            thread_id = summary.thread_id
+            if (summary.header('In-Reply-To') and thread_id
+                    and thread_id not in self._own_threads and thread_id not in thread_ids):
+                thread_ids.append(thread_id)
+        if not thread_ids:
+            return
+        sent = self.gmail_service.get_sent_threads(thread_ids)
+        for thread_id in thread_ids:
+            # Failed lookups count as not ours rather than being retried one by one
+            self._own_threads[thread_id] = sent.get(thread_id, False)
+
+    def schedule(self, message: Dict[str, Any], summary: MessageSummary, query: Query) -> ScheduledMessage:
+        score = self.score(summary)
+        return ScheduledMessage(
+            message=message,
+            summary=summary,
+            query=query,
+            score=score,
+            priority_class=self.priority_class(score)
+        )
+
+    def score(self, summary: MessageSummary) -> float:
+        score = 0.0
+
+        senders = [address.lower() for _, address in getaddresses([summary.header('From')])]
+        if any(self._is_important_sender(sender) for sender in senders):
+            score += IMPORTANT_SENDER_SCORE
+
+        if self._is_list_mail(summary):
+            score += LIST_MAIL_SCORE
+        elif self.own_address:
+            recipients = [address.lower() for _, address in getaddresses([summary.header('To')])]
+            if self.own_address in recipients:
+                score += DIRECT_RECIPIENT_SCORE
+
+        if summary.header('In-Reply-To') and self._is_own_thread(summary.thread_id):
+            score += REPLY_TO_OWN_THREAD_SCORE
+
+        # Up to MAX_RECENCY_SCORE for brand new mail, fading out over as many hours
+        if summary.internal_date:
+            age_hours = max(0.0, time.time() - summary.internal_date / 1000) / 3600
+            score += max(0.0, MAX_RECENCY_SCORE - age_hours)
+
+        return score
+
+    def priority_class(self, score: float) -> str:
+        if score >= self.config.high_priority_score:
+            return 'high'
+        if score < 0:
+            return 'low'
+        return 'normal'
+
+    def _is_important_sender(self, sender: str) -> bool:
+        for important in self.config.important_senders:
+            if important.startswith('@'):
+                if sender.endswith(important):
+                    return True
+            elif sender == important:
+                return True
+        return False
+
+    @staticmethod
+    def _is_list_mail(summary: MessageSummary) -> bool:
+        if any(summary.header(name) for name in LIST_HEADERS):
+            return True
+        return summary.header('Precedence').lower() in BULK_PRECEDENCE
+
+    def _is_own_thread(self, thread_id: str) -> bool:
+        if not thread_id:
+            return False
+        if thread_id not in self._own_threads:
+            # Normally prefetched; a lone lookup is still batched
+            self._own_threads[thread_id] = self.gmail_service.get_sent_threads([thread_id]).get(thread_id, False)
+        return self._own_threads[thread_id]
+
+
+class PriorityScheduler:
+    """
+    Dispatches scheduled items highest score first on a worker pool.
+
+    Items are anything with a score, priority_class and label, such as a
+    ScheduledMessage or a whole thread of them. Each priority class has its
+    own concurrency cap, so a deep queue of low priority mail can never
+    occupy all workers.
+    """
+
+    def __init__(self, config: Scheduling):
+        self.workers = config.workers
+        self.max_concurrency = config.max_concurrency
+
+    def run(self, items: List[Any], handler: Callable[[Any], None]) -> None:
+        """Run handler for every item, returning once all of them are done"""
+        order = itertools.count()
+        queues: Dict[str, list] = {priority_class: [] for priority_class in PRIORITY_CLASSES}
+        for item in items:
+            heapq.heappush(queues[item.priority_class], (-item.score, next(order), item))
+
+        running = {priority_class: 0 for priority_class in PRIORITY_CLASSES}
+        in_flight = {}
+
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            while True:
+                while len(in_flight) < self.workers:
+                    priority_class = self._next_class(queues, running)
+                    if priority_class is None:
+                        break
+                    _, _, item = heapq.heappop(queues[priority_class])
+                    running[priority_class] += 1
+                    in_flight[executor.submit(handler, item)] = (priority_class, item)
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    priority_class, item = in_flight.pop(future)
+                    running[priority_class] -= 1
+                    if future.exception() is not None:
+                        print(f"Error processing {item.label}: {future.exception()}")
+
+    def _next_class(self, queues: Dict[str, list], running: Dict[str, int]):
+        """Class whose best waiting item has the highest score and a free slot"""
+        best = None
+        for priority_class in PRIORITY_CLASSES:
+            queue = queues[priority_class]
+            if not queue or running[priority_class] >= self.max_concurrency[priority_class]:
+                continue
+            if best is None or queue[0][:2] < queues[best][0][:2]:
+                best = priority_class
+        return best
@@ -0,0 +1,186 @@
+"""
+Thread-aware classification: grouping by conversation and reusing thread decisions
+"""
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+from dataclasses import asdict, dataclass, field
+from email.utils import getaddresses
+from typing import Dict, List, Optional
+
+from coordination.locks import file_lock
+from gmail.content import MessageSummary
+from processing.priority import ScheduledMessage
+
+
+# Replies that carry no information the model would need to see
+ACKNOWLEDGEMENTS = {
+    'ok', 'okay', 'thanks', 'thank you', 'thanks a lot', 'many thanks', 'thx', 'ty',
+    'got it', 'noted', 'sounds good', 'great', 'perfect', 'will do', 'done', 'agreed',
+    '1',  # "+1" once punctuation is stripped
+}
+
+
+@dataclass
+class ThreadDecision:
+    """Last classification of a thread"""
+    thread_id: str
+    important: bool
+    reason: str
+    participants: List[str]
+    decided_at: float
+    expires_at: float
+
+
+@dataclass
+class ScheduledThread:
+    """New messages of one thread, scheduled as a single unit"""
+    thread_id: str
+    messages: List[ScheduledMessage] = field(default_factory=list)
+
+    @property
+    def score(self) -> float:
+        return max(item.score for item in self.messages)
+
+    @property
+    def priority_class(self) -> str:
+        return max(self.messages, key=lambda item: item.score).priority_class
+
+    @property
+    def summaries(self) -> List[MessageSummary]:
+        """Summaries ordered oldest first"""
+        return sorted((item.summary for item in self.messages), key=lambda summary: summary.internal_date)
+
+    @property
+    def label(self) -> str:
+        return f"thread {self.thread_id}"
+
+
+def group_by_thread(items: List[ScheduledMessage]) -> List[ScheduledThread]:
+    """Group scheduled messages by threadId, keeping first-seen order"""
+    threads: Dict[str, ScheduledThread] = {}
+    for item in items:
+        # Messages without a thread ID are their own conversation
+        thread_id = item.summary.thread_id or item.summary.id
+        threads.setdefault(thread_id, ScheduledThread(thread_id)).messages.append(item)
+    return list(threads.values())
+
+
+def sender_addresses(summaries: List[MessageSummary]) -> List[str]:
+    """Lowercased sender addresses of messages, without duplicates"""
+    senders = []
+    for summary in summaries:
+        for _, address in getaddresses([summary.header('From')]):
+            if address and address.lower() not in senders:
+                senders.append(address.lower())
+    return senders
+
+
+def is_content_free(summary: MessageSummary) -> bool:
+    """Whether a reply is empty or a bare acknowledgement, without attachments"""
+    if any(part.is_attachment for part in summary.parts):
+        return False
+    text = re.sub(r'[^\w\s]', '', summary.snippet).lower()
+    text = ' '.join(text.split())
+    return text == '' or text in ACKNOWLEDGEMENTS
+
+
+class ThreadDecisionStore:
+    """
+    Small JSON file store of thread decisions with expiry.
+
+    Decisions are kept in memory and written back with save(), atomically,
+    once per cycle. Expired decisions are dropped on load and save.
+    """
+
+    def __init__(self, filename: str, ttl_seconds: float):
+        self.filename = filename
+        self.ttl_seconds = ttl_seconds
+        self._decisions: Dict[str, ThreadDecision] = {}
+        self._dirty = False
+        self._lock = threading.Lock()
+        self._load()
+
+    def get(self, thread_id: str) -> Optional[ThreadDecision]:
+        """Get a thread's decision unless it has expired"""
+        with self._lock:
+            decision = self._decisions.get(thread_id)
+            if decision is None or decision.expires_at <= time.time():
+                return None
+            return decision
+
+    def put(self, thread_id: str, important: bool, reason: str, participants: List[str]) -> ThreadDecision:
+        """Record a decision, refreshing its expiry"""
+        now = time.time()
+        decision = ThreadDecision(
+            thread_id=thread_id,
+            important=important,
+            reason=reason,
+            participants=participants,
+            decided_at=now,
+            expires_at=now + self.ttl_seconds
+        )
+        with self._lock:
+            self._decisions[thread_id] = decision
+            self._dirty = True
+        return decision
+
+    def save(self) -> None:
+        """
+        Write decisions to disk if anything changed.
+
+        Workers sharing the file merge with what is on disk under a file lock,
+        keeping the newest decision per thread, so no worker drops another's.
+        """
+        with self._lock:
+            if not self._dirty:
+                return
+
+        try:
+            with file_lock(self.filename):
+                on_disk = self._read_file()
+                with self._lock:
+                    for thread_id, decision in on_disk.items():
+                        current = self._decisions.get(thread_id)
+                        if current is None or decision.decided_at > current.decided_at:
+                            self._decisions[thread_id] = decision
+                    self._prune()
+                    data = {thread_id: asdict(decision) for thread_id, decision in self._decisions.items()}
+                    self._dirty = False
+
+                directory = os.path.dirname(os.path.abspath(self.filename))
+                fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.thread_decisions.')
+                with os.fdopen(fd, 'w') as f:
+                    json.dump(data, f)
+                os.replace(tmp_path, self.filename)
+        except OSError as e:
+            print(f"Warning: Could not save thread decisions: {e}")
+
+    def __len__(self) -> int:
+        return len(self._decisions)
+
+    def _load(self) -> None:
+        self._decisions = self._read_file()
+        self._prune()
+
+    def _read_file(self) -> Dict[str, ThreadDecision]:
+        if not os.path.exists(self.filename):
+            return {}
+        try:
+            with open(self.filename, 'r') as f:
+                data = json.load(f)
+            return {thread_id: ThreadDecision(**decision) for thread_id, decision in data.items()}
+        except (OSError, ValueError, TypeError) as e:
+            print(f"Warning: Could not load thread decisions, ignoring them: {e}")
+            return {}
+
+    def _prune(self) -> None:
+        now = time.time()
+        expired = [thread_id for thread_id, decision in self._decisions.items() if decision.expires_at <= now]
+        for thread_id in expired:
+            del self._decisions[thread_id]
+        if expired:
+            self._dirty = True
@@ -22,7 +22,10 @@ except ImportError as e:
 
 try:
     from gmail.client import create_service
+    from gmail.credentials import CredentialsManager
     from gmail.service import GmailService
+    from gmail.content import MessageContentStore
+    from gmail.queries import QueryPlanner
     print("✓ Gmail modules imported successfully")
 except ImportError as e:
     print(f"✗ Gmail modules import failed: {e}")
@@ -39,4 +42,18 @@ try:
 except ImportError as e:
     print(f"✗ Classifier module import failed: {e}")
 
+try:
+    from processing.priority import PriorityScorer, PriorityScheduler
+    from processing.threads import ThreadDecisionStore
+    print("✓ Processing modules imported successfully")
+except ImportError as e:
+    print(f"✗ Processing modules import failed: {e}")
+
+try:
+    from coordination.backends import create_backend
+    from coordination.coordinator import ShardCoordinator
+    print("✓ Coordination modules imported successfully")
+except ImportError as e:
+    print(f"✗ Coordination modules import failed: {e}")
+
 print("\nAll imports completed!")
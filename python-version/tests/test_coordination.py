@@ -0,0 +1,100 @@
+"""
+Tests for splitting work between workers through shard leases and thread claims
+"""
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'src'))
+
+from coordination.backends import InMemoryLeaseBackend, SQLiteLeaseBackend
+from coordination.coordinator import ShardCoordinator
+
+
+SHARDS = 16
+THREADS = [f"t{i}" for i in range(40)]
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def backend(request, tmp_path):
+    if request.param == 'memory':
+        backend = InMemoryLeaseBackend()
+    else:
+        backend = SQLiteLeaseBackend(str(tmp_path / 'leases.db'))
+    yield backend
+    backend.close()
+
+
+def make_worker(backend, name, lease_ttl_seconds=2, heartbeat_seconds=0.5):
+    return ShardCoordinator(backend, 'test', SHARDS, worker_id=name,
+                            lease_ttl_seconds=lease_ttl_seconds, heartbeat_seconds=heartbeat_seconds)
+
+
+def settle(workers):
+    """Run heartbeats until every worker has seen the others and taken its share"""
+    for _ in range(3):
+        for worker in workers:
+            worker.rebalance()
+
+
+def owner_of(workers, thread_id):
+    return next(worker for worker in workers if worker.owns(thread_id))
+
+
+def test_workers_split_shards(backend):
+    workers = [make_worker(backend, 'a'), make_worker(backend, 'b')]
+    settle(workers)
+
+    first, second = (worker.owned_shards() for worker in workers)
+    assert workers[0].live_workers() == ['a', 'b']
+    assert len(first) == len(second) == SHARDS // 2
+    assert not first & second
+    assert first | second == set(range(SHARDS))
+
+
+def test_thread_is_claimed_once(backend):
+    workers = [make_worker(backend, 'a'), make_worker(backend, 'b')]
+    settle(workers)
+
+    for thread_id in THREADS:
+        claimed = [worker for worker in workers if worker.claim(thread_id)]
+        assert claimed == [owner_of(workers, thread_id)]
+
+
+def test_failed_thread_is_retried_elsewhere(backend):
+    first, second = make_worker(backend, 'a'), make_worker(backend, 'b')
+    settle([first, second])
+    done_thread = next(thread_id for thread_id in THREADS if first.owns(thread_id))
+    failed_thread = next(thread_id for thread_id in THREADS if first.owns(thread_id) and thread_id != done_thread)
+
+    assert first.claim(done_thread) and first.claim(failed_thread)
+    first.finish(done_thread, done=True)
+    first.finish(failed_thread, done=False)
+    first.stop()
+    second.rebalance()
+
+    assert second.owned_shards() == set(range(SHARDS))
+    # A finished thread stays claimed for claim_ttl, a failed one is free right away
+    assert not second.claim(done_thread)
+    assert second.claim(failed_thread)
+
+
+def test_one_shot_run_keeps_ownership_past_lease_ttl(backend):
+    worker = make_worker(backend, 'a', lease_ttl_seconds=0.4, heartbeat_seconds=0.1)
+    other = make_worker(backend, 'b', lease_ttl_seconds=0.4, heartbeat_seconds=0.1)
+    worker.start()
+    assert worker.owned_shards() == set(range(SHARDS))
+    assert worker.claim('t1')
+
+    time.sleep(1.0)
+
+    assert worker.owned_shards() == set(range(SHARDS))
+    assert worker.claim('t2')
+    # The in-flight claim on t1 was renewed by the heartbeat, so finishing it still holds it
+    worker.finish('t1', done=True)
+    worker.stop()
+    other.rebalance()
+    assert other.owns('t1')
+    assert not other.claim('t1')